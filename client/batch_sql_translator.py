@@ -12,19 +12,79 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
 import shutil
 import config_parser
 import gcs_util
-import sys
 import uuid
 import time
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from os.path import dirname, join
 from macro_processor import MacroProcessor
 from google.cloud import bigquery_migration_v2
 
 
+# Factories building the source dialect proto for each supported translation type.
+# A dict lookup replaces the long if/elif chain that used to run per workflow.
+_DIALECT_FACTORIES = {
+    config_parser.TERADATA2BQ: lambda: bigquery_migration_v2.Dialect(
+        teradata_dialect=bigquery_migration_v2.TeradataDialect(
+            mode=bigquery_migration_v2.TeradataDialect.Mode.SQL)),
+    config_parser.BTEQ2BQ: lambda: bigquery_migration_v2.Dialect(
+        teradata_dialect=bigquery_migration_v2.TeradataDialect(
+            mode=bigquery_migration_v2.TeradataDialect.Mode.BTEQ)),
+    config_parser.REDSHIFT2BQ: lambda: bigquery_migration_v2.Dialect(
+        redshift_dialect=bigquery_migration_v2.RedshiftDialect()),
+    config_parser.ORACLE2BQ: lambda: bigquery_migration_v2.Dialect(
+        oracle_dialect=bigquery_migration_v2.OracleDialect()),
+    config_parser.HIVEQL2BQ: lambda: bigquery_migration_v2.Dialect(
+        hiveql_dialect=bigquery_migration_v2.HiveQLDialect()),
+    config_parser.SPARKSQL2BQ: lambda: bigquery_migration_v2.Dialect(
+        sparksql_dialect=bigquery_migration_v2.SparkSQLDialect()),
+    config_parser.SNOWFLAKE2BQ: lambda: bigquery_migration_v2.Dialect(
+        snowflake_dialect=bigquery_migration_v2.SnowflakeDialect()),
+    config_parser.NETEZZA2BQ: lambda: bigquery_migration_v2.Dialect(
+        netezza_dialect=bigquery_migration_v2.NetezzaDialect()),
+    config_parser.AZURESYNAPSE2BQ: lambda: bigquery_migration_v2.Dialect(
+        azure_synapse_dialect=bigquery_migration_v2.AzureSynapseDialect()),
+    config_parser.VERTICA2BQ: lambda: bigquery_migration_v2.Dialect(
+        vertica_dialect=bigquery_migration_v2.VerticaDialect()),
+}
+
+
+# A lazily-created migration service client shared by every translator instance.
+# Constructing a client opens a fresh gRPC channel and TLS session, which is
+# relatively expensive; the async client can be shared safely across coroutines
+# running on the same event loop.  The grpc-aio channel binds to the event loop
+# that is current when the client is built, so _get_client() must only be called
+# from inside the running loop — never from __init__ or other sync code.
+_shared_client = None
+
+
+def _get_client() -> bigquery_migration_v2.MigrationServiceAsyncClient:
+    global _shared_client
+    if _shared_client is None:
+        _shared_client = bigquery_migration_v2.MigrationServiceAsyncClient()
+    return _shared_client
+
+
+class TranslationTimeout(RuntimeError):
+    """Raised when a migration workflow doesn't finish within the polling deadline.
+
+    The workflow keeps running server-side; callers can catch this to resume polling
+    at a slower cadence instead of losing the workflow handle.
+    """
+
+    def __init__(self, workflow_id: str, elapsed_seconds: int, last_state):
+        super().__init__("The job %s is still in state %s after %d seconds."
+                         % (workflow_id, last_state, elapsed_seconds))
+        self.workflow_id = workflow_id
+        self.elapsed_seconds = elapsed_seconds
+        self.last_state = last_state
+
+
 class BatchSqlTranslator:
     """A class to manage Batch SQL Translation job using the bigquery_migration_v2
     python client library.
@@ -33,10 +93,17 @@ class BatchSqlTranslator:
 
     def __init__(self, config, preprocessor: MacroProcessor):
         self.config = config
-        self.client = bigquery_migration_v2.MigrationServiceClient()
         self.gcs_path = None
         self.preprocessor = preprocessor    # May be None
         self.tmp_dir = join(dirname(self.config.input_directory), self.__TMP_DIR_NAME)
+        # Delete any tmp tree left behind by a previous run in the background, so the
+        # unlink syscalls overlap auth validation and input enumeration.  The future is
+        # awaited before anything is written to the tmp directory; shutdown(wait=False)
+        # lets the submitted removal finish while releasing the executor's thread
+        # afterwards instead of leaking it per instance.
+        cleanup_executor = ThreadPoolExecutor(max_workers=1)
+        self.__stale_tmp_cleanup = cleanup_executor.submit(shutil.rmtree, self.tmp_dir, ignore_errors=True)
+        cleanup_executor.shutdown(wait=False)
 
     __JOB_FINISHED_STATES = {
         bigquery_migration_v2.types.MigrationWorkflow.State.COMPLETED,
@@ -47,16 +114,17 @@ class BatchSqlTranslator:
     # This directory will be deleted (by default) after the job finishes.
     __TMP_DIR_NAME = ".tmp_processed"
 
-    def start_translation(self):
-        """Waits until the workflow finishes by calling the Migration Service API every 5 seconds.
+    async def start_translation(self):
+        """Runs the translation job end to end.
 
-        workflow_id: the workflow id in the format of
-        length_seconds: max wait time.
+        The method is a coroutine so that callers can run several translation jobs
+        concurrently with asyncio.gather.
         """
         local_input_dir = self.config.input_directory
         local_output_dir = self.config.output_directory
         if self.preprocessor is not None:
             print("Start pre-processing input query files...")
+            self.__stale_tmp_cleanup.result()
             local_input_dir = join(self.tmp_dir, "input")
             local_output_dir = join(self.tmp_dir, "output")
             self.preprocessor.preprocess(self.config.input_directory, local_input_dir)
@@ -65,12 +133,14 @@ class BatchSqlTranslator:
         gcs_input_path = join("gs://%s" % self.config.gcs_bucket, self.gcs_path, "input")
         gcs_output_path = join("gs://%s" % self.config.gcs_bucket, self.gcs_path, "output")
         print("Uploading inputs to gcs ...")
-        gcs_util.upload_directory(local_input_dir, self.config.gcs_bucket, join(self.gcs_path, "input"))
+        await gcs_util.upload_directory(local_input_dir, self.config.gcs_bucket, join(self.gcs_path, "input"),
+                                        num_workers=self.config.gcs_concurrency)
         print("Start translation job...")
-        job_name = self.create_migration_workflow(gcs_input_path, gcs_output_path)
-        self.__wait_until_job_finished(job_name)
+        job_name = await self.create_migration_workflow(gcs_input_path, gcs_output_path)
+        await self.__wait_until_job_finished(job_name)
         print("Downloading outputs...")
-        gcs_util.download_directory(local_output_dir, self.config.gcs_bucket, join(self.gcs_path, "output"))
+        await gcs_util.download_directory(local_output_dir, self.config.gcs_bucket, join(self.gcs_path, "output"),
+                                          num_workers=self.config.gcs_concurrency)
 
         if self.preprocessor is not None:
             print("Start post-processing by reverting the macros substitution...")
@@ -80,11 +150,16 @@ class BatchSqlTranslator:
 
         if self.config.clean_up_tmp_files:
             print("Cleaning up tmp files...")
-            shutil.rmtree(self.tmp_dir)
+            try:
+                shutil.rmtree(self.tmp_dir)
+            except FileNotFoundError:
+                # No tmp tree on this run (no preprocessor configured); nothing to
+                # stat first, the failed removal itself is the existence check.
+                pass
 
         print("The job finished successfully!")
         print(
-            "To view the job details, please go to the link: %s" % self.__get_ui_link())
+            "To view the job details, please go to the link: %s" % self.get_ui_link())
         print("Thank you for using the python exemplary library!")
 
     def __generate_gcs_path(self) -> str:
@@ -94,32 +169,45 @@ class BatchSqlTranslator:
         return ("%s-%s-%s" % (self.config.translation_type, datetime.now().strftime('%Y-%m-%d')
                               , str(uuid.uuid4())))
 
-    def __get_ui_link(self) -> str:
+    def get_ui_link(self) -> str:
         """Returns the http link to the offline translation page for this project.
         """
         return ("https://console.cloud.google.com/bigquery/migrations/offline-translation?projectnumber=%s" %
                 self.config.project_number)
 
-    def __wait_until_job_finished(self, workflow_id: str, length_seconds: int = 600):
-        """Waits until the workflow finishes by calling the Migration Service API every 5 seconds.
+    # Truncated exponential backoff parameters for the job status polling loop.
+    # The delay starts at 1 second, grows by 1.5x after every poll and is capped at 60
+    # seconds.  It resets back to 1 second whenever the job state makes progress.
+    __MIN_POLLING_DELAY_SECONDS = 1.0
+    __MAX_POLLING_DELAY_SECONDS = 60.0
+    __POLLING_DELAY_MULTIPLIER = 1.5
+
+    async def __wait_until_job_finished(self, workflow_id: str, length_seconds: int = 600):
+        """Waits until the workflow finishes by polling the Migration Service API with
+        truncated exponential backoff.
 
         workflow_id: the workflow id in the format of
         length_seconds: max wait time.
         """
         start_time = time.time()
         processing_seconds = 0
+        delay = self.__MIN_POLLING_DELAY_SECONDS
+        last_state = None
         while processing_seconds < length_seconds:
-            time.sleep(5)
-            processing_seconds = int(time.time() - start_time);
-            job_status = self.get_migration_workflow(workflow_id)
+            await asyncio.sleep(delay)
+            delay = min(delay * self.__POLLING_DELAY_MULTIPLIER, self.__MAX_POLLING_DELAY_SECONDS)
+            processing_seconds = int(time.time() - start_time)
+            job_status = await self.get_migration_workflow(workflow_id)
+            if job_status.state != last_state:
+                # The job made progress; poll eagerly again to catch the next transition.
+                last_state = job_status.state
+                delay = self.__MIN_POLLING_DELAY_SECONDS
             print("Translation job status is %s. Processing time: %s seconds" % (job_status.state, processing_seconds))
             if job_status.state in self.__JOB_FINISHED_STATES:
                 return
-        print("The job is still running after %d seconds. Please go to the UI page and download the outputs manually %s"
-              % (processing_seconds, self.__get_ui_link()))
-        sys.exit()
+        raise TranslationTimeout(workflow_id, processing_seconds, last_state)
 
-    def list_migration_workflows(self, num_jobs=5):
+    async def list_migration_workflows(self, num_jobs=5):
         """Lists the most recent bigquery migration workflows status and prints on the terminal.
 
         num_jobs: the number of workflows to print (default value is 5).
@@ -127,15 +215,19 @@ class BatchSqlTranslator:
         print("List migration workflows for project %s" % self.config.project_number)
         request = bigquery_migration_v2.ListMigrationWorkflowsRequest(
             parent="projects/%s/locations/%s" % (self.config.project_number, self.config.location),
+            page_size=num_jobs,
         )
 
-        page_result = self.client.list_migration_workflows(request=request)
+        page_result = await _get_client().list_migration_workflows(request=request)
 
-        for i, response in enumerate(page_result):
-            if i < num_jobs:
-                print(response)
+        i = 0
+        async for response in page_result:
+            if i >= num_jobs:
+                break
+            print(response)
+            i += 1
 
-    def get_migration_workflow(self, job_name):
+    async def get_migration_workflow(self, job_name):
         """Starts a get API call for a migration workflow and print out the status on terminal.
         """
         print("Get migration workflows for %s" % job_name)
@@ -143,10 +235,10 @@ class BatchSqlTranslator:
             name=job_name,
         )
 
-        page_result = self.client.get_migration_workflow(request=request)
+        page_result = await _get_client().get_migration_workflow(request=request)
         return page_result
 
-    def create_migration_workflow(self, gcs_input_path: str, gcs_output_path: str) -> str:
+    async def create_migration_workflow(self, gcs_input_path: str, gcs_output_path: str) -> str:
         """Creates a migration workflow and returns the name of the workflow.
         """
         target_dialect = bigquery_migration_v2.Dialect();
@@ -176,34 +268,11 @@ class BatchSqlTranslator:
             migration_workflow=workflow,
         )
 
-        response = self.client.create_migration_workflow(request=request)
+        response = await _get_client().create_migration_workflow(request=request)
         print(response)
         return response.name
 
     def get_input_dialect(self) -> bigquery_migration_v2.Dialect:
         """Returns the input dialect proto based on the translation type in the config.
         """
-        dialect = bigquery_migration_v2.Dialect()
-        if self.config.translation_type == config_parser.TERADATA2BQ:
-            dialect.teradata_dialect = bigquery_migration_v2.TeradataDialect(
-                mode=bigquery_migration_v2.TeradataDialect.Mode.SQL)
-        elif self.config.translation_type == config_parser.BTEQ2BQ:
-            dialect.teradata_dialect = bigquery_migration_v2.TeradataDialect(
-                mode=bigquery_migration_v2.TeradataDialect.Mode.BTEQ)
-        elif self.config.translation_type == config_parser.REDSHIFT2BQ:
-            dialect.redshift_dialect = bigquery_migration_v2.RedshiftDialect()
-        elif self.config.translation_type == config_parser.ORACLE2BQ:
-            dialect.oracle_dialect = bigquery_migration_v2.OracleDialect()
-        elif self.config.translation_type == config_parser.HIVEQL2BQ:
-            dialect.hiveql_dialect = bigquery_migration_v2.HiveQLDialect()
-        elif self.config.translation_type == config_parser.SPARKSQL2BQ:
-            dialect.sparksql_dialect = bigquery_migration_v2.SparkSQLDialect()
-        elif self.config.translation_type == config_parser.SNOWFLAKE2BQ:
-            dialect.snowflake_dialect = bigquery_migration_v2.SnowflakeDialect()
-        elif self.config.translation_type == config_parser.NETEZZA2BQ:
-            dialect.netezza_dialect = bigquery_migration_v2.NetezzaDialect()
-        elif self.config.translation_type == config_parser.AZURESYNAPSE2BQ:
-            dialect.azure_synapse_dialect = bigquery_migration_v2.AzureSynapseDialect()
-        elif self.config.translation_type == config_parser.VERTICA2BQ:
-            dialect.vertica_dialect = bigquery_migration_v2.VerticaDialect()
-        return dialect
+        return _DIALECT_FACTORIES[self.config.translation_type]()
@@ -12,12 +12,33 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
+import json
+import logging
 import yaml
 import os
 
+try:
+    import tomllib
+except ImportError:   # Python < 3.11.
+    tomllib = None
+
+try:
+    # Optional SIMD-accelerated JSON parser; the stdlib module is the fallback.
+    import orjson
+except ImportError:
+    orjson = None
+
 from argparse import Namespace
 from object_mapping_parser import ObjectMappingParser
-from yaml.loader import SafeLoader
+
+try:
+    # The libyaml-backed loader parses several times faster than the pure-python one.
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml.loader import SafeLoader
+
+logger = logging.getLogger(__name__)
 
 AZURESYNAPSE2BQ = "Translation_AzureSynapse2BQ"
 BTEQ2BQ = "Translation_Bteq2BQ"
@@ -31,6 +52,29 @@ TERADATA2BQ = "Translation_Teradata2BQ"
 VERTICA2BQ = "Translation_Vertica2BQ"
 
 
+@functools.lru_cache()
+def _load_config_file(config_file: str, mtime_ns: int):
+    """Loads the config file into a dict, memoized by path and modification time.
+
+    The format is picked from the file extension: .json and .toml configs parse much
+    faster than yaml, which stays the default.  Repeated invocations against an
+    unchanged file reuse the parsed result instead of re-reading and re-parsing.
+    """
+    suffix = os.path.splitext(config_file)[1].lower()
+    if suffix == ".json":
+        if orjson is not None:
+            with open(config_file, "rb") as f:
+                return orjson.loads(f.read())
+        with open(config_file) as f:
+            return json.load(f)
+    if suffix == ".toml":
+        assert tomllib is not None, "Reading .toml config files requires Python 3.11 or newer."
+        with open(config_file, "rb") as f:
+            return tomllib.load(f)
+    with open(config_file) as f:
+        return yaml.load(f, Loader=SafeLoader)
+
+
 class TranslationConfig:
     """A structure for holding the config info of the translation job.
     """
@@ -44,6 +88,7 @@ class TranslationConfig:
         self.output_directory = None
         self.object_name_mapping_list = None
         self.clean_up_tmp_files = True
+        self.gcs_concurrency = 16
 
 
 class ConfigParser:
@@ -59,6 +104,7 @@ class ConfigParser:
     __INPUT_DIR = "input_directory"
     __OUTPUT_DIR = "output_directory"
     __CLEAN_UP = "clean_up_tmp_files"
+    __GCS_CONCURRENCY = "gcs_concurrency"
 
     # Config default values
     __DEFAULT_INPUT_DIR = "input"
@@ -82,12 +128,12 @@ class ConfigParser:
         """Parses the config file into TranslationConfig.
 
         Args:
-            config_file: path to the config file.  Default value is config.yaml.
+            config_file: path to the config file.  Default value is config.yaml.  Files with a
+                .json or .toml extension are parsed in the equivalent format.
         Return:
             translation config.
         """
-        with open(config_file) as f:
-            data = yaml.load(f, Loader=SafeLoader)
+        data = _load_config_file(config_file, os.stat(config_file).st_mtime_ns)
         self.validate_config_yaml(data)
 
         config = TranslationConfig()
@@ -99,12 +145,20 @@ class ConfigParser:
         translation_config_input = data[self.__TRANSLATION_CONFIG]
         config.location = translation_config_input["location"]
         config.translation_type = translation_config_input[self.__TRANSLATION_TYPE]
-        config.input_directory = self.__DEFAULT_INPUT_DIR if self.__INPUT_DIR not in translation_config_input \
-            else translation_config_input[self.__INPUT_DIR]
-        config.output_directory = self.__DEFAULT_OUTPUT_DIR if self.__OUTPUT_DIR not in translation_config_input \
-            else translation_config_input[self.__OUTPUT_DIR]
+        # Resolve both directories to absolute form once so downstream code doesn't
+        # re-stat or re-resolve them.
+        config.input_directory = os.path.abspath(
+            self.__DEFAULT_INPUT_DIR if self.__INPUT_DIR not in translation_config_input
+            else translation_config_input[self.__INPUT_DIR])
+        config.output_directory = os.path.abspath(
+            self.__DEFAULT_OUTPUT_DIR if self.__OUTPUT_DIR not in translation_config_input
+            else translation_config_input[self.__OUTPUT_DIR])
+        assert os.path.isdir(config.input_directory), \
+            "Can't find input directory %s." % config.input_directory
         config.clean_up_tmp_files = True if self.__CLEAN_UP not in translation_config_input \
             else translation_config_input[self.__CLEAN_UP]
+        if self.__GCS_CONCURRENCY in translation_config_input:
+            config.gcs_concurrency = translation_config_input[self.__GCS_CONCURRENCY]
 
         if not os.path.exists(config.output_directory):
             os.makedirs(config.output_directory)
@@ -113,8 +167,9 @@ class ConfigParser:
             config.object_name_mapping_list = \
                 ObjectMappingParser(self.__argument.object_name_mapping).get_name_mapping_list()
 
-        print("Finished Parsing translation config: ")
-        print('\n'.join("     %s: %s" % item for item in vars(config).items()))
+        logger.info("Finished parsing translation config.")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('\n'.join("     %s: %s" % item for item in vars(config).items()))
         return config
 
     def validate_config_yaml(self, yaml_data):
@@ -13,16 +13,45 @@
 # limitations under the License.
 
 import fnmatch
+import functools
+import logging
 import os
 import re
 import shutil
 import yaml
 
 from argparse import Namespace
-from yaml.loader import SafeLoader
+from concurrent.futures import ThreadPoolExecutor
 from os.path import dirname, isfile, join
 from typing import Dict
 
+try:
+    # The libyaml-backed loader parses several times faster than the pure-python one.
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml.loader import SafeLoader
+
+try:
+    # Optional C extension.  The macro keys are plain literals, so an Aho-Corasick
+    # automaton can find all of them in one linear scan, with a cost independent of
+    # the number of macros; the regex alternation remains the fallback.
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache()
+def _load_macros_file(yaml_file_path: str, mtime_ns: int):
+    """Loads the macro map yaml file into a dict, memoized by path and modification time.
+
+    Repeated constructions against an unchanged file reuse the parsed result, the same
+    way config_parser caches the translation config.
+    """
+    with open(yaml_file_path) as f:
+        return yaml.load(f, Loader=SafeLoader)
+
 
 class MacroProcessor:
     """A processor to handle macros in the query files during the pre-processing and post-processing stages of a Batch
@@ -59,6 +88,9 @@ class MacroProcessor:
             return True
         return False
 
+    # Extensions copied through verbatim instead of being macro-expanded.
+    __SKIP_EXTS = frozenset({'.zip', '.json', '.csv'})
+
     def is_processable(self, path, name) -> bool:
         """Returns true if a file is preprocessable.
 
@@ -67,9 +99,11 @@ class MacroProcessor:
         """
         if self.is_ignored(path, name):
             return False
-        if name.lower().endswith(('.zip', '.json', '.csv')):
-            return False
-        return True
+        return os.path.splitext(name)[1].lower() not in self.__SKIP_EXTS
+
+    # The number of files processed concurrently.  The per-file work is dominated by
+    # file I/O, during which the interpreter releases the GIL.
+    __MAX_PROCESS_WORKERS = min(32, (os.cpu_count() or 1) * 4)
 
     def __process(self, input_dir: str, output_dir: str, revert_expansion=False):
         """Replaces or restores macros for every file in the input folder and save outputs in a new folder.
@@ -77,67 +111,125 @@ class MacroProcessor:
         Note that this method is called for varying combinations of input and output directories
         at different points in the process.
 
+        The per-file work fans out over a thread pool; the output directories are created
+        up front by the main thread so the workers only read and write files.
+
         Args:
             input_dir: path to the input directory.
             output_dir: path to the output directory.
             revert_expansion: whether to revert the macro substitution.
         """
-        for (root, dirs, files) in os.walk(input_dir):
-            for name in files:
-                sub_dir = root[len(input_dir):]
-                if sub_dir.startswith("/"):
-                    sub_dir = sub_dir[1:]
-                input_path = join(input_dir, sub_dir, name)
-                output_path = join(output_dir, sub_dir, name)
-                if self.is_ignored(input_path, name):
-                    continue
-                os.makedirs(dirname(output_path), exist_ok=True)
-                if not self.is_processable(input_path, name):
-                    shutil.copy(input_path, output_path)
+        with ThreadPoolExecutor(max_workers=self.__MAX_PROCESS_WORKERS) as executor:
+            futures = []
+            created_dirs = set()
+            for entry in self.__walk_files(input_dir):
+                rel_path = entry.path[len(input_dir):]
+                if rel_path.startswith("/"):
+                    rel_path = rel_path[1:]
+                output_path = join(output_dir, rel_path)
+                if self.is_ignored(entry.path, entry.name):
                     continue
-                # The user may implement entirely different logic for macro expansion
-                # vs. unexpansion, especially if they are migrating between systems,
-                # so we use a boolean flag to separate the paths again here.
-                if not revert_expansion:
-                    self.preprocess_file(input_path, output_path)
-                else:
-                    self.postprocess_file(input_path, output_path)
+                # Create each output directory once instead of per file.
+                output_file_dir = dirname(output_path)
+                if output_file_dir not in created_dirs:
+                    os.makedirs(output_file_dir, exist_ok=True)
+                    created_dirs.add(output_file_dir)
+                # Decide processability here, where the walk has just classified the
+                # entry, instead of re-statting the path in the worker.
+                futures.append(executor.submit(self.__process_file, entry.path, output_path, revert_expansion,
+                                               self.is_processable(entry.path, entry.name)))
+            for future in futures:
+                future.result()
+        logger.info("Finished %s %d files into \"%s\".",
+                    "post-processing" if revert_expansion else "pre-processing", len(futures), output_dir)
+
+    def __walk_files(self, root: str):
+        """Yields a DirEntry for every file under root recursively.
+
+        os.scandir serves is_file/is_dir from the cached directory entry, avoiding the
+        extra stat per entry that os.walk plus isfile would issue.
+        """
+        try:
+            entries = os.scandir(root)
+        except FileNotFoundError:
+            # A paused job can finish having downloaded nothing, so the output tree
+            # may not exist; os.walk treated that as an empty walk and so do we.
+            return
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    yield from self.__walk_files(entry.path)
+                elif entry.is_file():
+                    # Follows symlinks, like the gcs upload walker: a linked query
+                    # file is still an input file.
+                    yield entry
+
+    def __process_file(self, input_path: str, output_path: str, revert_expansion: bool, processable: bool):
+        """Replaces or restores macros for a single file.
+        """
+        if not processable:
+            # copyfile skips the extra stat/chmod of shutil.copy and uses the
+            # kernel zero-copy path where the platform provides one.
+            shutil.copyfile(input_path, output_path)
+            return
+        # The user may implement entirely different logic for macro expansion
+        # vs. unexpansion, especially if they are migrating between systems,
+        # so we use a boolean flag to separate the paths again here.
+        if not revert_expansion:
+            self.preprocess_file(input_path, output_path)
+        else:
+            self.postprocess_file(input_path, output_path)
+
+    # The buffer size used when streaming file contents through the macro expander.
+    __IO_BUFFER_SIZE = 1 << 20
 
     def preprocess_file(self, input_path: str, tmp_path: str):
-        print("Preprocessing %s" % input_path)
-        with open(input_path) as input_fh:
-            text = input_fh.read()
-        text = self.preprocess_text(text, input_path)
-        with open(tmp_path, "w") as tmp_fh:
-            tmp_fh.write(text)
+        """Preprocesses the given file by streaming it through the macro expander.
 
-    def preprocess_text(self, text: str, input_path: str):
-        return self.expander.expand(text, input_path)
+        The file is processed chunk by chunk instead of being read into memory whole,
+        so peak memory stays bounded regardless of file size.
+        The user may replace this method with any locally-specified implementation.
+        """
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Preprocessing %s", input_path)
+        with open(input_path, buffering=self.__IO_BUFFER_SIZE) as input_fh:
+            with open(tmp_path, "w", buffering=self.__IO_BUFFER_SIZE) as tmp_fh:
+                self.expander.expand_stream(input_fh, tmp_fh, input_path)
 
     def postprocess_file(self, tmp_path: str, output_path: str):
         """Postprocesses the given file, after conversion to the target dialect.
 
+        The file is streamed through the macro expander chunk by chunk, like
+        preprocess_file.
         The user may replace this method with any locally-specified implementation.
-        If only simple textual replacement is required, it may be easier to modify postprocess_text.
 
         Not all users will want postprocessing, and some may just copy the file.
         """
-        print("Postprocessing into %s" % output_path)
-        with open(tmp_path) as tmp_fh:
-            text = tmp_fh.read()
-        text = self.postprocess_text(text, output_path)
-        with open(output_path, "w") as output_fh:
-            output_fh.write(text)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Postprocessing into %s", output_path)
+        with open(tmp_path, buffering=self.__IO_BUFFER_SIZE) as tmp_fh:
+            with open(output_path, "w", buffering=self.__IO_BUFFER_SIZE) as output_fh:
+                self.expander.unexpand_stream(tmp_fh, output_fh, output_path)
 
-    def postprocess_text(self, text: str, output_path: str) -> str:
-        """Postprocesses the given text, after conversion to the target dialect.
 
-        The user may replace this method with any locally-specified implementation.
-        If access to the file is required, modify postprocess_file instead, and (optionally) delete this method.
+class _Replacements(dict):
+    """A substitution map that is also a valid re.sub callback.
 
-        Not all users will want postprocessing, and some may just return text.
-        """
-        return self.expander.unexpand(text, output_path)
+    Passing the map itself to sub avoids allocating a fresh lambda closure per
+    substitution call.
+    """
+
+    def __init__(self, token_map):
+        super().__init__(token_map)
+        # When every key and value is a single character the whole map collapses to
+        # a str.translate table: one C-level scan, no regex engine at all.
+        if self and all(len(key) == 1 == len(value) for key, value in self.items()):
+            self.translation = str.maketrans(dict(self))
+        else:
+            self.translation = None
+
+    def __call__(self, match):
+        return self[match.group(0)]
 
 
 class MapBasedExpander:
@@ -150,14 +242,67 @@ class MapBasedExpander:
         self.yaml_file_path = yaml_file_path
         self.macro_expansion_maps = self.__parse_macros_config_file()
         self.reversed_maps = self.__get_reversed_maps()
+        # Compile each file map glob to a regex once; matching N files against the
+        # same few globs is then a compiled match instead of an fnmatch call that
+        # re-derives the pattern every time.
+        self.__glob_patterns = {file_key: re.compile(fnmatch.translate(file_key))
+                                for file_key in self.macro_expansion_maps}
+        self.__pattern_cache = {}
+        # Seed the cache with the per-glob tables so the common case of a file
+        # matching a single glob never compiles a regex at call time.
+        for file_key, token_map in self.macro_expansion_maps.items():
+            self.__pattern_cache[((file_key,), False)] = self.__compile_matchers(token_map)
+        for file_key, token_map in self.reversed_maps.items():
+            self.__pattern_cache[((file_key,), True)] = self.__compile_matchers(token_map)
+
+    @classmethod
+    def __compile_matchers(cls, token_map: Dict[str, str]):
+        """ Builds the (token map, compiled regex, automaton) triple cached per glob set.
+        """
+        replacements = _Replacements(token_map)
+        return replacements, cls.__compile_tokens(replacements), cls.__build_automaton(replacements)
+
+    @staticmethod
+    def __build_automaton(token_map: Dict[str, str]):
+        """ Builds an Aho-Corasick automaton over the token keys.
+
+        Returns None when the optional ahocorasick extension is not installed or the
+        map is empty, in which case the regex alternation is used instead.
+        """
+        if ahocorasick is None or not token_map:
+            return None
+        automaton = ahocorasick.Automaton()
+        for key in token_map:
+            automaton.add_word(key, key)
+        automaton.make_automaton()
+        return automaton
+
+    @staticmethod
+    def __compile_tokens(token_map: Dict[str, str]):
+        """ Compiles the token keys into a single alternation regex.
+
+        Escaping is only needed to build the pattern; the substitution maps stay keyed
+        by the raw literals so the match callbacks look tokens up without re-escaping.
+        Python's re picks the leftmost alternative, not the longest, so the keys are
+        sorted by descending length to stop a short macro from shadowing a longer one
+        that shares its prefix.
+        """
+        keys = sorted(token_map, key=len, reverse=True)
+        if any("\x00" in key for key in keys):
+            # NUL can't be used as the join sentinel below; escape key by key.
+            return re.compile("|".join(re.escape(key) for key in keys))
+        # One re.escape call over all keys joined by a sentinel, split back apart,
+        # instead of a Python-level call per key.  Escaping is per-character, so the
+        # result is identical.
+        return re.compile("|".join(re.escape("\x00".join(keys)).split(re.escape("\x00"))))
 
     def expand(self, text: str, path: str) -> str:
         """ Expands the macros in the text with the corresponding values defined in the macros_substitution_map file.
 
         Returns the text after macro substitution.
         """
-        reg_pattern_map, patterns = self.__get_all_regex_pattern_mapping(path)
-        return patterns.sub(lambda m: reg_pattern_map[re.escape(m.group(0))], text)
+        reg_pattern_map, patterns, automaton = self.__get_all_regex_pattern_mapping(path)
+        return self.__substitute_text(text, reg_pattern_map, patterns, automaton)
 
     def unexpand(self, text: str, path: str):
         """ Reverts the macros substitution by replacing the values with macros defined in the macros_substitution_map
@@ -165,8 +310,105 @@ class MapBasedExpander:
 
         Returns the text after replacing the values with macros.
         """
-        reg_pattern_map, patterns = self.__get_all_regex_pattern_mapping(path, True)
-        return patterns.sub(lambda m: reg_pattern_map[re.escape(m.group(0))], text)
+        reg_pattern_map, patterns, automaton = self.__get_all_regex_pattern_mapping(path, True)
+        return self.__substitute_text(text, reg_pattern_map, patterns, automaton)
+
+    def __substitute_text(self, text: str, reg_pattern_map, patterns, automaton) -> str:
+        """ Substitutes every macro occurrence in the whole text.
+        """
+        if not reg_pattern_map:
+            # No glob matched the path, so there is nothing to substitute.  Without
+            # this the empty alternation would match at every position.
+            return text
+        if reg_pattern_map.translation is not None:
+            return text.translate(reg_pattern_map.translation)
+        if automaton is None:
+            return patterns.sub(reg_pattern_map, text)
+        return self.__substitute_prefix(text, len(text), reg_pattern_map, patterns, automaton)[0]
+
+    # The chunk size used when streaming text through the expander.
+    __CHUNK_SIZE = 1 << 20
+
+    def expand_stream(self, input_fh, output_fh, path: str):
+        """ Expands the macros while streaming text from input_fh to output_fh in chunks.
+
+        Only a bounded window of the text is held in memory at any time.
+        """
+        reg_pattern_map, patterns, automaton = self.__get_all_regex_pattern_mapping(path)
+        self.__substitute_stream(input_fh, output_fh, reg_pattern_map, patterns, automaton)
+
+    def unexpand_stream(self, input_fh, output_fh, path: str):
+        """ Reverts the macros substitution while streaming text from input_fh to output_fh in chunks.
+        """
+        reg_pattern_map, patterns, automaton = self.__get_all_regex_pattern_mapping(path, True)
+        self.__substitute_stream(input_fh, output_fh, reg_pattern_map, patterns, automaton)
+
+    def __substitute_stream(self, input_fh, output_fh, reg_pattern_map, patterns, automaton):
+        """ Substitutes macros chunk by chunk, holding back the tail of each chunk so a
+        macro spanning a chunk boundary is still matched once the next chunk arrives.
+        """
+        if not reg_pattern_map:
+            # No macros apply to this file; stream it through untouched.
+            shutil.copyfileobj(input_fh, output_fh, self.__CHUNK_SIZE)
+            return
+        if reg_pattern_map.translation is not None:
+            # Single-character maps can never span a chunk boundary, so each chunk
+            # is translated independently.
+            while True:
+                chunk = input_fh.read(self.__CHUNK_SIZE)
+                if not chunk:
+                    return
+                output_fh.write(chunk.translate(reg_pattern_map.translation))
+        # A match that starts more than holdback characters before the end of the
+        # buffer can never extend into unread text.
+        holdback = max((len(key) for key in reg_pattern_map), default=1) - 1
+        buffer = ""
+        while True:
+            chunk = input_fh.read(self.__CHUNK_SIZE)
+            if not chunk:
+                break
+            buffer += chunk
+            cut = len(buffer) - holdback
+            if cut <= 0:
+                continue
+            substituted, buffer = self.__substitute_prefix(buffer, cut, reg_pattern_map, patterns, automaton)
+            output_fh.write(substituted)
+        output_fh.write(self.__substitute_text(buffer, reg_pattern_map, patterns, automaton))
+
+    def __substitute_prefix(self, buffer: str, cut: int, reg_pattern_map, patterns, automaton):
+        """ Substitutes every match starting before cut and returns the substituted prefix
+        together with the unprocessed remainder of the buffer.
+        """
+        pieces = []
+        pos = 0
+        for start, key in self.__iter_matches(buffer, patterns, automaton):
+            if start >= cut:
+                break
+            pieces.append(buffer[pos:start])
+            pieces.append(reg_pattern_map[key])
+            pos = start + len(key)
+        emit_end = max(cut, pos)
+        pieces.append(buffer[pos:emit_end])
+        return "".join(pieces), buffer[emit_end:]
+
+    def __iter_matches(self, buffer: str, patterns, automaton):
+        """ Yields (start, key) for each non-overlapping match in buffer, left to right.
+
+        The automaton reports every occurrence, including overlaps, so its hits are
+        reduced to the same leftmost, longest-key-first selection the sorted regex
+        alternation makes.
+        """
+        if automaton is None:
+            for match in patterns.finditer(buffer):
+                yield match.start(), match.group(0)
+            return
+        hits = sorted(((end - len(key) + 1, key) for end, key in automaton.iter(buffer)),
+                      key=lambda hit: (hit[0], -len(hit[1])))
+        last_end = 0
+        for start, key in hits:
+            if start >= last_end:
+                yield start, key
+                last_end = start + len(key)
 
     def __get_reversed_maps(self) -> Dict[str, Dict[str, str]]:
         """ Swaps key and value in the macro maps and return the new map.
@@ -186,8 +428,7 @@ class MapBasedExpander:
         """
         assert isfile(self.yaml_file_path), "Can't find a file at \"%s\"." % self.yaml_file_path
 
-        with open(self.yaml_file_path) as f:
-            data = yaml.load(f, Loader=SafeLoader)
+        data = _load_macros_file(self.yaml_file_path, os.stat(self.yaml_file_path).st_mtime_ns)
         self.__validate_macro_file(data)
         return data[self.__YAML_KEY]
 
@@ -199,12 +440,20 @@ class MapBasedExpander:
 
     def __get_all_regex_pattern_mapping(self, file_path: str, use_reversed_map=False):
         """ Compiles all the macros matched with the file path into a single regex pattern.
+
+        The merged map and compiled pattern are cached by the tuple of matching file map
+        keys, so every file matching the same globs reuses the same compiled regex
+        instead of re-merging and re-compiling the macro table.
         """
         macro_subst_maps = self.reversed_maps if use_reversed_map else self.macro_expansion_maps
-        reg_pattern_map = {}
-        for file_map_key, token_map in macro_subst_maps.items():
-            if fnmatch.fnmatch(file_path, file_map_key):
-                for key, value in token_map.items():
-                    reg_pattern_map[re.escape(key)] = value
-        all_patterns = re.compile("|".join(reg_pattern_map.keys()))
-        return reg_pattern_map, all_patterns
+        matched_keys = tuple(file_map_key for file_map_key in macro_subst_maps
+                             if self.__glob_patterns[file_map_key].match(file_path))
+        cache_key = (matched_keys, use_reversed_map)
+        cached = self.__pattern_cache.get(cache_key)
+        if cached is None:
+            reg_pattern_map = {}
+            for file_map_key in matched_keys:
+                reg_pattern_map.update(macro_subst_maps[file_map_key])
+            cached = self.__compile_matchers(reg_pattern_map)
+            self.__pattern_cache[cache_key] = cached
+        return cached
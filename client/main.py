@@ -14,31 +14,46 @@
 
 
 import argparse
-import batch_sql_translator
-
-from config_parser import ConfigParser
-from gcloud_auth_helper import validate_gcloud_auth_settings
-from macro_processor import MacroProcessor
-from object_mapping_parser import ObjectMappingParser
-
-parser = argparse.ArgumentParser(description='Config the Batch Sql translation tool.')
-parser.add_argument('-m', '--macros', type=str,
-                    help='Path to the macro map yaml file. If specified, the program will pre-process '
-                         'all the input query files by replacing the macros with corresponding '
-                         'string values according to the macro map definition. After translation, '
-                         'the program will revert the substitutions for all the output query files in a '
-                         'post-processing step.  The replacement does not apply for files with extension of '
-                         '.zip, .csv, .json.')
-parser.add_argument('-o', '--object_name_mapping', type=str,
-                    help='Path to the object name mapping json file. Name mapping lets you identify the names of SQL '
-                         'objects in your source files, and specify target names for those objects in BigQuery. More '
-                         'info please see https://cloud.google.com/bigquery/docs/output-name-mapping.')
-args = parser.parse_args()
-
-
-def start_translation():
+import asyncio
+import logging
+import sys
+
+def build_parser() -> argparse.ArgumentParser:
+    """Builds the argument parser for the translation tool.
+    """
+    parser = argparse.ArgumentParser(description='Config the Batch Sql translation tool.')
+    parser.add_argument('-m', '--macros', type=str,
+                        help='Path to the macro map yaml file. If specified, the program will pre-process '
+                             'all the input query files by replacing the macros with corresponding '
+                             'string values according to the macro map definition. After translation, '
+                             'the program will revert the substitutions for all the output query files in a '
+                             'post-processing step.  The replacement does not apply for files with extension of '
+                             '.zip, .csv, .json.')
+    parser.add_argument('-o', '--object_name_mapping', type=str,
+                        help='Path to the object name mapping json file. Name mapping lets you identify the names of '
+                             'SQL objects in your source files, and specify target names for those objects in '
+                             'BigQuery. More info please see '
+                             'https://cloud.google.com/bigquery/docs/output-name-mapping.')
+    return parser
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Parses the command line arguments (sys.argv by default).
+    """
+    return build_parser().parse_args(argv)
+
+
+def start_translation(args: argparse.Namespace):
     """Starts a batch sql translation job.
     """
+    # Imported here rather than at module scope: the google.cloud client libraries
+    # take a noticeable fraction of a second to import, which would otherwise be
+    # paid even for --help and argument errors.
+    import batch_sql_translator
+    from config_parser import ConfigParser
+    from gcloud_auth_helper import validate_gcloud_auth_settings
+    from macro_processor import MacroProcessor
+
     print("Reading translation config file from config.yaml")
     config = ConfigParser(args).parse_config()
     print("Verify cloud login and credential settings...")
@@ -48,8 +63,14 @@ def start_translation():
     else:
         preprocessor = None
     translator = batch_sql_translator.BatchSqlTranslator(config, preprocessor)
-    translator.start_translation()
+    try:
+        asyncio.run(translator.start_translation())
+    except batch_sql_translator.TranslationTimeout as timeout:
+        print(timeout)
+        print("Please go to the UI page and download the outputs manually %s" % translator.get_ui_link())
+        sys.exit(1)
 
 
 if __name__ == '__main__':
-    start_translation()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    start_translation(parse_args())
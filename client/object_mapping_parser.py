@@ -15,6 +15,12 @@
 import os
 import json
 
+try:
+    # Optional SIMD-accelerated JSON parser; the stdlib module is the fallback.
+    import orjson
+except ImportError:
+    orjson = None
+
 from google.cloud.bigquery_migration_v2 import ObjectNameMappingList
 from google.cloud.bigquery_migration_v2 import ObjectNameMapping
 from google.cloud.bigquery_migration_v2 import NameMappingKey
@@ -45,8 +51,13 @@ class ObjectMappingParser:
         print("Start parsing object name mapping from \"%s\"..." % self.__json_file_path)
         self.__validate_onm_file()
         onm_list = ObjectNameMappingList()
-        f = open(self.__json_file_path)
-        data = json.load(f)
+        if orjson is not None:
+            # orjson parses bytes directly, skipping the text decode step.
+            with open(self.__json_file_path, "rb") as f:
+                data = orjson.loads(f.read())
+        else:
+            with open(self.__json_file_path) as f:
+                data = json.load(f)
         for name_map in data[self.__NAME_MAP_FIELD]:
             assert self.__SOURCE_FIELD in name_map, \
                 "Invalid object name mapping: can't find a \"%s\" field in \"%s\". Instead we got \"%s\"." \